@@ -9,7 +9,7 @@ This module contains tools for:
 - Visualizing CFGs as Mermaid diagrams
 """
 
-from .cfg_generator import pseudocode_to_cfg, flowchart_to_cfg, cfg_to_dict, CFG, CFGNode
+from .cfg_generator import pseudocode_to_cfg, flowchart_to_cfg, flowchart_to_cfg_bytes, cfg_to_dict, CFG, CFGNode
 from .cfg_canonicalizer import canonicalize_cfg, calculate_cfg_similarity
 from .cfg_comparator import compare_cfgs
 from .cfg_visualizer import cfg_to_mermaid
@@ -19,6 +19,7 @@ from .solution_validator import validate_solution_relevance
 __all__ = [
     'pseudocode_to_cfg',
     'flowchart_to_cfg',
+    'flowchart_to_cfg_bytes',
     'cfg_to_dict',
     'CFG',
     'CFGNode',
@@ -0,0 +1,37 @@
+"""
+Request coalescing for Gemini calls.
+
+Callers awaiting an identical (model, prompt) pair while one request for it is
+already in flight share that request's response instead of sending their own.
+Distinct prompts go straight to `generate_content_async` with no added wait;
+each is still its own round-trip.
+"""
+
+import asyncio
+
+
+class PromptCoalescer:
+    """In-flight dedup map around `GenerativeModel.generate_content_async`"""
+
+    def __init__(self):
+        # (model_name, prompt) -> future of the request currently in flight
+        self._inflight = {}
+
+    async def submit(self, model, prompt: str):
+        """Send a prompt to Gemini, joining an identical request already in flight"""
+        key = (model.model_name, prompt)
+        future = self._inflight.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            future = asyncio.ensure_future(model.generate_content_async(prompt))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so one caller being cancelled doesn't cancel the shared request
+        return await asyncio.shield(future)
+
+    def _forget(self, key: tuple, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+
+# Shared coalescer used by the analyzers
+gemini_coalescer = PromptCoalescer()
@@ -1,13 +1,20 @@
+import logging
 import google.generativeai as genai
 import json
+import orjson
 from .cfg_generator import CFG, CFGNode, cfg_to_dict
 from . import config
 from . import utils
 from . import prompts
+from .batcher import gemini_coalescer
 from cache import generate_cache_key, get_cached_response, set_cached_response
 
+logger = logging.getLogger(__name__)
+
 genai.configure(api_key=config.GOOGLE_API_KEY)
 
+_MODEL = genai.GenerativeModel(config.GEMINI_MODEL)
+
 
 def validate_canonical_cfg(result: dict) -> dict:
     """Validate and ensure canonical CFG has required fields"""
@@ -74,24 +81,28 @@ async def canonicalize_cfg(cfg: CFG, problem_statement: str) -> dict:
         cfg_dict = cfg_to_dict(cfg)
 
         # Check cache first
-        cache_key = generate_cache_key("canonicalize_cfg", json.dumps(cfg_dict, sort_keys=True), problem_statement)
+        cache_key = generate_cache_key(
+            "canonicalize_cfg",
+            orjson.dumps(cfg_dict, option=orjson.OPT_SORT_KEYS),
+            problem_statement,
+        )
         cached = get_cached_response("canonicalize_cfg", cache_key)
         if cached is not None:
             return cached
 
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
         prompt = f"""{prompts.CANONICALIZE_CFG_PROMPT}
 
 Problem Statement:
 {problem_statement}
 
 Original CFG to Canonicalize:
-{json.dumps(cfg_dict, indent=2)}
+{utils.to_pretty_json(cfg_dict)}
 
 Generate the canonical base-level CFG that captures the essential algorithmic structure."""
 
-        response = model.generate_content(prompt)
-        print("Canonical CFG response:", response.text)
+        response = await gemini_coalescer.submit(_MODEL, prompt)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Canonical CFG response: %s", response.text)
 
         # Clean and parse response
         result = utils.parse_json_response(response.text)
@@ -105,8 +116,9 @@ Generate the canonical base-level CFG that captures the essential algorithmic st
         return result
 
     except json.JSONDecodeError as e:
-        print(f"JSON parsing error in canonicalize_cfg: {e}")
-        print(f"Response text: {response.text}")
+        logger.warning("JSON parsing error in canonicalize_cfg: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response text: %s", response.text)
         # Return a minimal valid canonical CFG
         return {
             "nodes": cfg_dict.get("nodes", []),
@@ -119,10 +131,7 @@ Generate the canonical base-level CFG that captures the essential algorithmic st
             "canonical_patterns": ["unknown"],
         }
     except Exception as e:
-        print(f"Error in canonicalize_cfg: {e}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error in canonicalize_cfg")
         raise
 
 
@@ -132,8 +141,8 @@ async def calculate_cfg_similarity(user_cfg: dict, reference_cfg: dict, problem_
     # Check cache first
     cache_key = generate_cache_key(
         "calculate_cfg_similarity",
-        json.dumps(user_cfg, sort_keys=True),
-        json.dumps(reference_cfg, sort_keys=True),
+        orjson.dumps(user_cfg, option=orjson.OPT_SORT_KEYS),
+        orjson.dumps(reference_cfg, option=orjson.OPT_SORT_KEYS),
         str(problem_statement),
     )
     cached = get_cached_response("calculate_cfg_similarity", cache_key)
@@ -141,21 +150,21 @@ async def calculate_cfg_similarity(user_cfg: dict, reference_cfg: dict, problem_
         return cached
 
     try:
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
         problem_context = f"\n\nProblem Statement:\n{problem_statement}\n" if problem_statement else ""
         prompt = f"""{prompts.CALCULATE_SIMILARITY_PROMPT}
 {problem_context}
 Reference CFG (canonical base-level):
-{json.dumps(reference_cfg, indent=2)}
+{utils.to_pretty_json(reference_cfg)}
 
 User's CFG:
-{json.dumps(user_cfg, indent=2)}
+{utils.to_pretty_json(user_cfg)}
 
 FIRST: Verify the user's solution is relevant to the problem. If not, return score 0 with explanation.
 THEN: Evaluate how well the user's solution matches the canonical structure."""
 
-        response = model.generate_content(prompt)
-        print("Similarity calculation response:", response.text)
+        response = await gemini_coalescer.submit(_MODEL, prompt)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Similarity calculation response: %s", response.text)
 
         # Clean and parse response
         result = utils.parse_json_response(response.text)
@@ -169,8 +178,9 @@ THEN: Evaluate how well the user's solution matches the canonical structure."""
         return result
 
     except json.JSONDecodeError as e:
-        print(f"JSON parsing error in calculate_cfg_similarity: {e}")
-        print(f"Response text: {response.text}")
+        logger.warning("JSON parsing error in calculate_cfg_similarity: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response text: %s", response.text)
         # Return a default similarity result
         return {
             "total_score": 50,
@@ -198,8 +208,5 @@ THEN: Evaluate how well the user's solution matches the canonical structure."""
             "recommendations": ["Please try submitting again"],
         }
     except Exception as e:
-        print(f"Error in calculate_cfg_similarity: {e}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error in calculate_cfg_similarity")
         raise
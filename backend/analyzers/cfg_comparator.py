@@ -1,14 +1,20 @@
+import logging
 import google.generativeai as genai
-import json
+import orjson
 from typing import Dict
 from .cfg_generator import CFG, cfg_to_dict
 from . import config
 from . import utils
 from . import prompts
+from .batcher import gemini_coalescer
 from cache import generate_cache_key, get_cached_response, set_cached_response
 
+logger = logging.getLogger(__name__)
+
 genai.configure(api_key=config.GOOGLE_API_KEY)
 
+_MODEL = genai.GenerativeModel(config.GEMINI_MODEL)
+
 
 async def compare_cfgs(cfg1: CFG, cfg2: CFG, problem_analysis: dict) -> dict:
     """Compare two CFGs and determine which solution is better"""
@@ -39,33 +45,33 @@ async def compare_cfgs(cfg1: CFG, cfg2: CFG, problem_analysis: dict) -> dict:
     # Check cache first
     cache_key = generate_cache_key(
         "compare_cfgs",
-        json.dumps(cfg1_dict, sort_keys=True),
-        json.dumps(cfg2_dict, sort_keys=True),
-        json.dumps(problem_analysis, sort_keys=True),
+        orjson.dumps(cfg1_dict, option=orjson.OPT_SORT_KEYS),
+        orjson.dumps(cfg2_dict, option=orjson.OPT_SORT_KEYS),
+        orjson.dumps(problem_analysis, option=orjson.OPT_SORT_KEYS),
     )
     cached = get_cached_response("compare_cfgs", cache_key)
     if cached is not None:
         return cached
 
-    model = genai.GenerativeModel(config.GEMINI_MODEL)
     prompt = f"""{system_prompt}
 
 Problem Analysis:
-{json.dumps(problem_analysis, indent=2)}
+{utils.to_pretty_json(problem_analysis)}
 
 Solution 1 CFG:
-{json.dumps(cfg1_dict, indent=2)}
+{utils.to_pretty_json(cfg1_dict)}
 
 Solution 2 CFG:
-{json.dumps(cfg2_dict, indent=2)}
+{utils.to_pretty_json(cfg2_dict)}
 
 Structural Metrics:
-{json.dumps(structural_metrics, indent=2)}
+{utils.to_pretty_json(structural_metrics)}
 
 Compare these solutions and determine which is better."""
 
-    response = model.generate_content(prompt)
-    print("Comparison response:", response.text)
+    response = await gemini_coalescer.submit(_MODEL, prompt)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Comparison response: %s", response.text)
     
     result = utils.parse_json_response(response.text)
 
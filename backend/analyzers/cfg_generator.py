@@ -1,18 +1,34 @@
+import logging
 import google.generativeai as genai
-import base64, json
+import json
+import threading
+import time
+from cachetools import TLRUCache
 from PIL import Image
 from io import BytesIO
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from typing import List, Dict, Optional
 from . import config
 from . import utils
 from . import prompts
-from cache import generate_cache_key, get_cached_response, set_cached_response, normalize_code
+from .batcher import gemini_coalescer
+from uploads import decode_base64_upload
+from cache import (
+    generate_cache_key,
+    get_cached_entry,
+    record_cache_hit,
+    set_cached_response,
+    normalize_code,
+)
+
+logger = logging.getLogger(__name__)
 
 genai.configure(api_key=config.GOOGLE_API_KEY)
 
+_MODEL = genai.GenerativeModel(config.GEMINI_MODEL)
 
-@dataclass
+
+@dataclass(slots=True)
 class CFGNode:
     """Represents a node in the Control Flow Graph"""
 
@@ -23,7 +39,7 @@ class CFGNode:
     condition: Optional[str] = None  # For DECISION nodes
 
 
-@dataclass
+@dataclass(slots=True)
 class CFG:
     """Represents a Control Flow Graph"""
 
@@ -76,29 +92,66 @@ def validate_cfg(cfg_data: dict) -> dict:
     return cfg_data
 
 
+def _build_cfg(cfg_data: dict) -> CFG:
+    """Build a CFG object from an already validated CFG dict"""
+    return CFG(
+        nodes=[CFGNode(**node) for node in cfg_data["nodes"]],
+        edges=cfg_data["edges"],
+        complexity=cfg_data["complexity"],
+        num_paths=cfg_data["num_paths"],
+        nesting_depth=cfg_data["nesting_depth"],
+    )
+
+
+# Recently built CFG objects by cache key: cache_key -> (CFG, expires_at).
+# Each entry expires with its response cache row; cachetools caches need an external lock.
+_CFG_CACHE_SIZE = 512
+_cfg_cache = TLRUCache(maxsize=_CFG_CACHE_SIZE, ttu=lambda _key, value, _now: value[1], timer=time.time)
+_cfg_cache_lock = threading.Lock()
+
+
+def _remember_cfg(cache_key: str, cfg: CFG, expires_at: Optional[int]) -> None:
+    if expires_at is not None:
+        with _cfg_cache_lock:
+            _cfg_cache[cache_key] = (cfg, expires_at)
+
+
+def _get_cached_cfg(call_type: str, cache_key: str) -> Optional[CFG]:
+    """
+    Return a cached CFG, reusing the built object when it is still in memory.
+    Cached dicts were validated before they were stored, so a hit from the
+    response cache is rebuilt without running validate_cfg again.
+    Either way the hit is counted against the response cache entry.
+    """
+    with _cfg_cache_lock:
+        entry = _cfg_cache.get(cache_key)
+    if entry is not None:
+        record_cache_hit(call_type, cache_key)
+        return entry[0]
+
+    cached = get_cached_entry(call_type, cache_key)
+    if cached is None:
+        return None
+
+    cfg = _build_cfg(cached[0])
+    _remember_cfg(cache_key, cfg, cached[1])
+    return cfg
+
+
 async def pseudocode_to_cfg(pseudocode: str) -> CFG:
     """Convert pseudocode to CFG using Gemini AI"""
 
     # Check cache first — normalize code to match trivially different inputs
     cache_key = generate_cache_key("pseudocode_to_cfg", normalize_code(pseudocode))
-    cached = get_cached_response("pseudocode_to_cfg", cache_key)
+    cached = _get_cached_cfg("pseudocode_to_cfg", cache_key)
     if cached is not None:
-        # Reconstruct CFG from cached dict
-        cached = validate_cfg(cached)
-        nodes = [CFGNode(**node) for node in cached["nodes"]]
-        return CFG(
-            nodes=nodes,
-            edges=cached["edges"],
-            complexity=cached["complexity"],
-            num_paths=cached["num_paths"],
-            nesting_depth=cached["nesting_depth"],
-        )
+        return cached
 
     try:
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
         prompt = f"{prompts.PSEUDOCODE_TO_CFG_PROMPT}\n\nPseudocode:\n{pseudocode}"
-        response = model.generate_content(prompt)
-        print("CFG from pseudocode response:", response.text)
+        response = await gemini_coalescer.submit(_MODEL, prompt)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("CFG from pseudocode response: %s", response.text)
 
         # Clean and parse response
         result = utils.parse_json_response(response.text)
@@ -107,22 +160,17 @@ async def pseudocode_to_cfg(pseudocode: str) -> CFG:
         result = validate_cfg(result)
 
         # Convert to CFG object
-        nodes = [CFGNode(**node) for node in result["nodes"]]
-        cfg = CFG(
-            nodes=nodes,
-            edges=result["edges"],
-            complexity=result["complexity"],
-            num_paths=result["num_paths"],
-            nesting_depth=result["nesting_depth"],
-        )
+        cfg = _build_cfg(result)
 
         # Store in cache (as dict for serialization)
-        set_cached_response("pseudocode_to_cfg", cache_key, result)
+        expires_at = set_cached_response("pseudocode_to_cfg", cache_key, result)
+        _remember_cfg(cache_key, cfg, expires_at)
 
         return cfg
     except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        print(f"Response text: {response.text}")
+        logger.warning("JSON parsing error: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response text: %s", response.text)
         # Return a minimal valid CFG
         return CFG(
             nodes=[
@@ -153,39 +201,65 @@ async def pseudocode_to_cfg(pseudocode: str) -> CFG:
             nesting_depth=0,
         )
     except Exception as e:
-        print(f"Error in pseudocode_to_cfg: {e}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error in pseudocode_to_cfg")
         raise
 
 
+# Image types Gemini accepts inline; anything else is re-encoded before sending
+_GEMINI_IMAGE_TYPES = frozenset({"image/png", "image/jpeg", "image/webp", "image/heic", "image/heif"})
+
+
+def _gemini_image(image_bytes: bytes, mime_type: Optional[str]) -> tuple[bytes, str]:
+    """
+    Return (data, mime_type) for an image part Gemini accepts. Supported images
+    are sent as-is; an unknown or unsupported type is sniffed with PIL and, if
+    still unsupported (GIF, BMP, TIFF, JPEG 2000, ...), re-encoded as lossless
+    WebP the way the SDK does for PIL images.
+    """
+    if mime_type and mime_type.lower() in _GEMINI_IMAGE_TYPES:
+        return image_bytes, mime_type.lower()
+
+    image = Image.open(BytesIO(image_bytes))
+    sniffed = Image.MIME.get(image.format)
+    if sniffed in _GEMINI_IMAGE_TYPES:
+        return image_bytes, sniffed
+
+    output = BytesIO()
+    image.save(output, format="webp", lossless=True)
+    return output.getvalue(), "image/webp"
+
+
 async def flowchart_to_cfg(base64_image: str) -> CFG:
-    """Convert flowchart image to CFG using Gemini vision"""
+    """Convert a base64 (optionally data-URI) flowchart image to CFG using Gemini vision"""
+    header = base64_image[: base64_image.find(",") + 1]
+    # An empty type (`data:;base64,`) is treated as unknown and sniffed
+    mime_type = (header[5:].split(";")[0] or None) if header.startswith("data:") else None
+
+    return await flowchart_to_cfg_bytes(decode_base64_upload(base64_image), mime_type)
 
-    # Check cache first
-    cache_key = generate_cache_key("flowchart_to_cfg", base64_image)
-    cached = get_cached_response("flowchart_to_cfg", cache_key)
+
+async def flowchart_to_cfg_bytes(image_bytes: bytes, mime_type: Optional[str] = None) -> CFG:
+    """
+    Convert raw flowchart image bytes to CFG using Gemini vision.
+    In-process callers (e.g. PDF extraction) use this directly to skip a
+    base64 round-trip. The MIME type is sniffed from the image if not given, and
+    formats Gemini doesn't accept are converted first.
+    """
+
+    # Check cache first (keyed on the image bytes, shared by both entry points)
+    cache_key = generate_cache_key("flowchart_to_cfg", image_bytes)
+    cached = _get_cached_cfg("flowchart_to_cfg", cache_key)
     if cached is not None:
-        cached = validate_cfg(cached)
-        nodes = [CFGNode(**node) for node in cached["nodes"]]
-        return CFG(
-            nodes=nodes,
-            edges=cached["edges"],
-            complexity=cached["complexity"],
-            num_paths=cached["num_paths"],
-            nesting_depth=cached["nesting_depth"],
-        )
+        return cached
 
     try:
-        # Decode base64 image
-        image_data = base64_image.split(",")[1] if "," in base64_image else base64_image
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(BytesIO(image_bytes))
+        data, mime_type = _gemini_image(image_bytes, mime_type)
 
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
-        response = model.generate_content([prompts.FLOWCHART_TO_CFG_PROMPT, image])
-        print("CFG from flowchart response:", response.text)
+        response = await _MODEL.generate_content_async(
+            [prompts.FLOWCHART_TO_CFG_PROMPT, {"mime_type": mime_type, "data": data}]
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("CFG from flowchart response: %s", response.text)
 
         # Clean and parse response
         result = utils.parse_json_response(response.text)
@@ -194,22 +268,17 @@ async def flowchart_to_cfg(base64_image: str) -> CFG:
         result = validate_cfg(result)
 
         # Convert to CFG object
-        nodes = [CFGNode(**node) for node in result["nodes"]]
-        cfg = CFG(
-            nodes=nodes,
-            edges=result["edges"],
-            complexity=result["complexity"],
-            num_paths=result["num_paths"],
-            nesting_depth=result["nesting_depth"],
-        )
+        cfg = _build_cfg(result)
 
         # Store in cache
-        set_cached_response("flowchart_to_cfg", cache_key, result)
+        expires_at = set_cached_response("flowchart_to_cfg", cache_key, result)
+        _remember_cfg(cache_key, cfg, expires_at)
 
         return cfg
     except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        print(f"Response text: {response.text}")
+        logger.warning("JSON parsing error: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response text: %s", response.text)
         # Return a minimal valid CFG
         return CFG(
             nodes=[
@@ -240,17 +309,25 @@ async def flowchart_to_cfg(base64_image: str) -> CFG:
             nesting_depth=0,
         )
     except Exception as e:
-        print(f"Error in flowchart_to_cfg: {e}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error in flowchart_to_cfg_bytes")
         raise
 
 
 def cfg_to_dict(cfg: CFG) -> dict:
     """Convert CFG object to dictionary for JSON serialization"""
+    # Built by hand rather than with asdict(), which deep-copies every field.
+    # next_nodes and edges are shared with the CFG, the same as edges always were.
     return {
-        "nodes": [asdict(node) for node in cfg.nodes],
+        "nodes": [
+            {
+                "id": node.id,
+                "type": node.type,
+                "label": node.label,
+                "next_nodes": node.next_nodes,
+                "condition": node.condition,
+            }
+            for node in cfg.nodes
+        ],
         "edges": cfg.edges,
         "complexity": cfg.complexity,
         "num_paths": cfg.num_paths,
@@ -1,7 +1,10 @@
+import logging
 from .cfg_generator import CFG
 from typing import Dict
 import re
 
+logger = logging.getLogger(__name__)
+
 
 def sanitize_label(label: str, max_length: int = 40) -> str:
     """Sanitize label for Mermaid diagram"""
@@ -150,10 +153,7 @@ def cfg_to_mermaid(cfg, title: str = "CFG") -> str:
         return "\n".join(mermaid_lines)
 
     except Exception as e:
-        print(f"Error in cfg_to_mermaid: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error in cfg_to_mermaid")
         return "graph TD\n    A[Error generating diagram]"
 
 
@@ -1,12 +1,18 @@
+import logging
 import google.generativeai as genai
 import json
 from . import config
 from . import utils
 from . import prompts
+from .batcher import gemini_coalescer
 from cache import generate_cache_key, get_cached_response, set_cached_response
 
+logger = logging.getLogger(__name__)
+
 genai.configure(api_key=config.GOOGLE_API_KEY)
 
+_MODEL = genai.GenerativeModel(config.GEMINI_MODEL)
+
 
 async def analyze_problem(problem_statement: str) -> dict:
     """Analyze problem statement to extract requirements and expected structure"""
@@ -17,10 +23,10 @@ async def analyze_problem(problem_statement: str) -> dict:
     if cached is not None:
         return cached
 
-    model = genai.GenerativeModel(config.GEMINI_MODEL)
     prompt = f"{prompts.ANALYZE_PROBLEM_PROMPT}\n\nProblem Statement:\n{problem_statement}"
-    response = model.generate_content(prompt)
-    print("Problem analysis response:", response.text)
+    response = await gemini_coalescer.submit(_MODEL, prompt)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Problem analysis response: %s", response.text)
 
     result = utils.parse_json_response(response.text)
 
@@ -1,16 +1,24 @@
+import logging
 import google.generativeai as genai
 import os
 import json
+import orjson
 from dotenv import load_dotenv
 from analyzers import config
+from analyzers import utils
+from analyzers.batcher import gemini_coalescer
 from cache import generate_cache_key, get_cached_response, set_cached_response
 
+logger = logging.getLogger(__name__)
+
 load_dotenv(override=True)
 api_key = os.getenv("GOOGLE_API_KEY")
 if not api_key:
     raise ValueError("GOOGLE_API_KEY not found in environment variables")
 genai.configure(api_key=api_key)
 
+_MODEL = genai.GenerativeModel(config.GEMINI_MODEL)
+
 
 async def validate_solution_relevance(user_cfg: dict, problem_statement: str) -> dict:
     """Validate that the user's solution is relevant to the problem statement"""
@@ -49,32 +57,32 @@ CRITICAL:
         # Check cache first
         cache_key = generate_cache_key(
             "validate_solution_relevance",
-            json.dumps(user_cfg, sort_keys=True),
+            orjson.dumps(user_cfg, option=orjson.OPT_SORT_KEYS),
             problem_statement,
         )
         cached = get_cached_response("validate_solution_relevance", cache_key)
         if cached is not None:
             return cached
 
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
         prompt = f"""{system_prompt}
 
 Problem Statement:
 {problem_statement}
 
 User's CFG:
-{json.dumps(user_cfg, indent=2)}
+{utils.to_pretty_json(user_cfg)}
 
 Determine if the user's solution is relevant to the problem."""
 
-        response = model.generate_content(prompt)
-        print("Solution validation response:", response.text)
+        response = await gemini_coalescer.submit(_MODEL, prompt)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Solution validation response: %s", response.text)
 
         # Clean and parse response
         response_text = response.text.strip()
         response_text = response_text.replace("```json", "").replace("```", "").strip()
 
-        result = json.loads(response_text)
+        result = orjson.loads(response_text)
 
         # Validate required fields
         if "is_relevant" not in result:
@@ -94,8 +102,9 @@ Determine if the user's solution is relevant to the problem."""
         return result
 
     except json.JSONDecodeError as e:
-        print(f"JSON parsing error in validate_solution_relevance: {e}")
-        print(f"Response text: {response.text}")
+        logger.warning("JSON parsing error in validate_solution_relevance: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response text: %s", response.text)
         # Default to allowing the solution if validation fails
         return {
             "is_relevant": True,
@@ -105,8 +114,5 @@ Determine if the user's solution is relevant to the problem."""
             "reasoning": "Validation error - defaulting to allow evaluation",
         }
     except Exception as e:
-        print(f"Error in validate_solution_relevance: {e}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error in validate_solution_relevance")
         raise
@@ -1,5 +1,9 @@
 import json
+import logging
 import re
+import orjson
+
+logger = logging.getLogger(__name__)
 
 
 def parse_json_response(response_text: str) -> dict:
@@ -15,13 +19,18 @@ def parse_json_response(response_text: str) -> dict:
             cleaned_text = re.sub(r"```\s*", "", cleaned_text)
 
         cleaned_text = cleaned_text.strip()
-        return json.loads(cleaned_text)
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        print(f"Original text: {response_text}")
+        return orjson.loads(cleaned_text)
+    except json.JSONDecodeError as e:  # orjson.JSONDecodeError subclasses it
+        logger.warning("JSON parsing error: %s", e)
+        logger.debug("Original text: %s", response_text)
         raise e
 
 
+def to_pretty_json(data) -> str:
+    """Serialize data as 2-space indented JSON for embedding in prompts."""
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8")
+
+
 def _parse_complexity_factors(c: str) -> dict:
     """
     Parse a complexity string into its component factors.
@@ -181,7 +190,7 @@ def compare_complexity(c1: str, c2: str) -> int:
     w1 = _complexity_weight(f1)
     w2 = _complexity_weight(f2)
 
-    print(f"Complexity comparison: {c1} (weight={w1}) vs {c2} (weight={w2})")
+    logger.debug("Complexity comparison: %s (weight=%s) vs %s (weight=%s)", c1, w1, c2, w2)
 
     if w1 < w2:
         return -1
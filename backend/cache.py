@@ -4,18 +4,189 @@ Caches Gemini API responses in SQLite to avoid redundant token usage.
 Same input content → same cached result (until TTL expires).
 """
 
-import hashlib
-import json
+import atexit
+import logging
 import os
 import re
-from datetime import datetime, timedelta
-from database import get_db_connection
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+import blake3
+import database
+import orjson
+from cachetools import TLRUCache
+import zstandard as zstd
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
+logger = logging.getLogger(__name__)
+
 # Cache TTL in hours (default 24h, configurable via .env)
 CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", "24"))
+CACHE_TTL_SECONDS = CACHE_TTL_HOURS * 3600
+
+# Background pruning interval in seconds (default 60, 0 disables; configurable via .env)
+CACHE_REAP_INTERVAL_SECONDS = int(os.getenv("CACHE_REAP_INTERVAL_SECONDS", "60"))
+
+# Comments are matched in a single left-to-right pass
+_COMMENT_RE = re.compile(r"//[^\n]*|#[^\n]*|/\*.*?\*/", re.DOTALL)
+_SEMICOLON_TABLE = str.maketrans("", "", ";")
+
+# Cache-key hashing: string parts are encoded in windows of this many characters,
+# and bytes parts at least this large are hashed with BLAKE3's multithreading
+_HASH_CHUNK_CHARS = 64 * 1024
+_PARALLEL_HASH_BYTES = 1024 * 1024
+# Keys and body hashes are 128-bit BLAKE3 digests (32 hex chars)
+_DIGEST_BYTES = 16
+# Text-only keys shorter than this are hashed in one shot (same digest)
+_SHORT_KEY_CHARS = 4096
+
+# Constant SQL so sqlite3's per-connection statement cache reuses the compiled plans
+# Call types are stored once in ai_call_type and referenced by integer id
+_CALL_TYPE_ID_SQL = "SELECT id FROM ai_call_type WHERE name = ?"
+_INSERT_CALL_TYPE_SQL = "INSERT OR IGNORE INTO ai_call_type (name) VALUES (?)"
+_SELECT_SQL = """SELECT b.body, c.expires_at FROM ai_cache c
+                 JOIN ai_cache_body b ON b.body_hash = c.body_hash
+                 WHERE c.call_type_id = ? AND c.content_hash = ? AND c.expires_at > ?"""
+_HIT_SQL = """UPDATE ai_cache SET hit_count = hit_count + ?
+              WHERE call_type_id = (SELECT id FROM ai_call_type WHERE name = ?) AND content_hash = ?"""
+# Response bodies are content-addressed, so identical responses share one row
+_INSERT_BODY_SQL = "INSERT OR IGNORE INTO ai_cache_body (body_hash, body) VALUES (?, ?)"
+_INSERT_SQL = """INSERT OR REPLACE INTO ai_cache
+                 (call_type_id, content_hash, body_hash, created_at, expires_at, hit_count)
+                 VALUES (?, ?, ?, ?, ?, 0)"""
+_OLD_BODY_SQL = "SELECT body_hash FROM ai_cache WHERE call_type_id = ? AND content_hash = ?"
+_DELETE_EXPIRED_SQL = "DELETE FROM ai_cache WHERE expires_at <= ? RETURNING body_hash"
+# Only bodies whose key rows were just deleted or overwritten are checked, each
+# through idx_cache_body, instead of scanning every body on each cleanup
+_DELETE_ORPHAN_BODY_SQL = """DELETE FROM ai_cache_body WHERE body_hash = ? AND NOT EXISTS
+                             (SELECT 1 FROM ai_cache c WHERE c.body_hash = ?)"""
+# Batched lookup: the wanted keys are joined against ai_cache so each one is a
+# unique-key index search (a row-value IN (VALUES ...) would scan the table)
+_BATCH_SELECT_SQL = """WITH wanted(call_type_id, content_hash) AS (VALUES {values})
+                       SELECT c.call_type_id, c.content_hash, b.body, c.expires_at
+                       FROM wanted w CROSS JOIN ai_cache c
+                         ON c.call_type_id = w.call_type_id AND c.content_hash = w.content_hash
+                       JOIN ai_cache_body b ON b.body_hash = c.body_hash
+                       WHERE c.expires_at > ?"""
+# Keys per batched statement, keeping bound parameters under SQLite's 999 limit
+_BATCH_SIZE = 400
+# Most recently stored live entries, for warming the L1 at startup
+_WARM_SQL = """SELECT t.name, c.content_hash, b.body, c.expires_at FROM ai_cache c
+               JOIN ai_cache_body b ON b.body_hash = c.body_hash
+               JOIN ai_call_type t ON t.id = c.call_type_id
+               WHERE c.expires_at > ? ORDER BY c.created_at DESC LIMIT ?"""
+_STATS_SQL = """SELECT t.name, COUNT(*),
+                        SUM(c.expires_at > ?),
+                        COALESCE(SUM(c.hit_count), 0),
+                        COALESCE(SUM(CASE WHEN c.expires_at > ? THEN c.hit_count END), 0)
+                 FROM ai_cache c JOIN ai_call_type t ON t.id = c.call_type_id
+                 GROUP BY c.call_type_id"""
+
+# Stored payloads are orjson bytes, zstd-compressed unless they are too small to
+# shrink; compressed rows are recognised by the zstd frame magic number
+_COMPRESS_MIN_BYTES = 256
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Per-thread state: the SQLite connection and zstd contexts (neither is thread-safe)
+_local = threading.local()
+
+# Hit counts are telemetry only, so they are buffered and written in batches by one
+# long-lived flusher thread, which keeps reusing its persistent connection
+HIT_FLUSH_INTERVAL_SECONDS = 5
+_hit_buffer = defaultdict(int)
+_hit_lock = threading.Lock()
+_hits_pending = threading.Event()
+_hit_flusher = None
+
+# In-process L1 in front of SQLite: (call_type, content_hash) -> (response, expires_at).
+# Each entry expires with its SQLite row; cachetools caches need an external lock.
+# Capacity in entries (default 2048, configurable via .env)
+L1_CACHE_SIZE = int(os.getenv("CACHE_L1_SIZE", "2048"))
+_l1 = TLRUCache(maxsize=L1_CACHE_SIZE, ttu=lambda _key, value, _now: value[1], timer=time.time)
+_l1_lock = threading.Lock()
+
+# (db_file, call type name) -> ai_call_type id; ids never change once assigned
+_call_type_ids = {}
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    Return this thread's persistent cache connection, opening it on first use.
+    Reopens if database.DB_FILE has been pointed at a different file.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.db_file == database.DB_FILE:
+        return conn
+    if conn is not None:
+        conn.close()
+
+    conn = sqlite3.connect(database.DB_FILE, timeout=30.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    # 64 MiB page cache (negative values are KiB) so hot index pages stay resident
+    conn.execute("PRAGMA cache_size=-65536")
+    _local.conn = conn
+    _local.db_file = database.DB_FILE
+    return conn
+
+
+def _call_type_id(conn: sqlite3.Connection, call_type: str, create: bool = False) -> int | None:
+    """
+    Return the ai_call_type id for a call type name, inserting it if `create`.
+    Ids read inside an open transaction aren't cached, since a rollback would
+    leave the cached id pointing at nothing; the caller caches it after commit.
+    """
+    key = (database.DB_FILE, call_type)
+    type_id = _call_type_ids.get(key)
+    if type_id is None:
+        if create:
+            conn.execute(_INSERT_CALL_TYPE_SQL, (call_type,))
+        row = conn.execute(_CALL_TYPE_ID_SQL, (call_type,)).fetchone()
+        if row is None:
+            return None
+        type_id = row[0]
+        if not conn.in_transaction:
+            _call_type_ids[key] = type_id
+    return type_id
+
+
+def _compressor() -> zstd.ZstdCompressor:
+    cctx = getattr(_local, "cctx", None)
+    if cctx is None:
+        cctx = _local.cctx = zstd.ZstdCompressor(level=3)
+    return cctx
+
+
+def _decompressor() -> zstd.ZstdDecompressor:
+    dctx = getattr(_local, "dctx", None)
+    if dctx is None:
+        dctx = _local.dctx = zstd.ZstdDecompressor()
+    return dctx
+
+
+def _encode_payload(response: dict) -> tuple[str, bytes]:
+    """Return (body_hash, stored body); the hash is taken over the JSON bytes."""
+    data = orjson.dumps(response)
+    body_hash = blake3.blake3(data).hexdigest(_DIGEST_BYTES)
+    if len(data) < _COMPRESS_MIN_BYTES:
+        return body_hash, data
+    compressed = _compressor().compress(data)
+    return body_hash, compressed if len(compressed) < len(data) else data
+
+
+def _decode_payload(blob: bytes):
+    if blob[:4] == _ZSTD_MAGIC:
+        blob = _decompressor().decompress(blob)
+    return orjson.loads(blob)
 
 
 def normalize_code(code: str) -> str:
@@ -24,155 +195,357 @@ def normalize_code(code: str) -> str:
     Strips semicolons, extra whitespace, comments, and other syntactic noise
     so that 'return true;' and 'return true' produce the same cache key.
     """
-    # Remove single-line comments (// ... and # ...)
-    text = re.sub(r'//.*$', '', code, flags=re.MULTILINE)
-    text = re.sub(r'#.*$', '', text, flags=re.MULTILINE)
-
-    # Remove multi-line comments (/* ... */)
-    text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
+    # Remove single-line (// ... and # ...) and multi-line (/* ... */) comments;
+    # the regex is skipped entirely when no comment opener can be present
+    text = _COMMENT_RE.sub("", code) if ("/" in code or "#" in code) else code
 
     # Remove semicolons
-    text = text.replace(';', '')
+    text = text.translate(_SEMICOLON_TABLE)
 
-    # Normalize all whitespace: tabs, multiple spaces, \r\n → single space
-    text = re.sub(r'\s+', ' ', text)
+    # Normalize all whitespace (tabs, multiple spaces, \r\n → single space) and
+    # strip the ends in one C-level split/join, then lowercase
+    return " ".join(text.split()).lower()
 
-    # Strip leading/trailing whitespace
-    text = text.strip()
 
-    # Lowercase for case-insensitive matching
-    text = text.lower()
+def generate_cache_key(call_type: str, *content_parts: str | bytes) -> str:
+    """
+    Generate a deterministic 128-bit (32-hex) BLAKE3 hash from call type + content.
+    The call type and content parts are separated by a NUL byte, which does
+    not appear in prompt text or code, so part boundaries cannot be shifted.
+    Parts are streamed into the hasher: bytes parts (e.g. orjson output or raw
+    image data) are hashed in place, and large strings are encoded in windows
+    instead of being copied into one big bytes object.
+    """
+    # Common case: a few short strings. Hashing their NUL-joined encoding in a
+    # single call gives the streamed digest without the per-part update calls.
+    if all(type(part) is str for part in content_parts) and sum(map(len, content_parts)) < _SHORT_KEY_CHARS:
+        joined = "\x00".join((call_type, *content_parts))
+        return blake3.blake3(joined.encode("utf-8")).hexdigest(_DIGEST_BYTES)
 
-    return text
+    hasher = _key_hasher(call_type, content_parts)
+    for part in content_parts:
+        _hash_part(hasher, part)
+    return hasher.hexdigest(_DIGEST_BYTES)
 
 
-def generate_cache_key(call_type: str, *content_parts: str) -> str:
+def generate_cache_keys(call_type: str, contents: list[str | bytes]) -> list[str]:
     """
-    Generate a deterministic SHA-256 hash from call type + content.
-    Multiple content parts are joined with a separator to avoid collisions.
+    Generate cache keys for several single-part contents under one call type,
+    equal to [generate_cache_key(call_type, c) for c in contents]. The call type
+    is hashed once and each key continues from a copy of that hasher state.
     """
-    combined = call_type + "||" + "||".join(str(p) for p in content_parts)
-    return hashlib.sha256(combined.encode("utf-8")).hexdigest()
+    prefix = _key_hasher(call_type, contents)
+    keys = []
+    for content in contents:
+        hasher = prefix.copy()
+        _hash_part(hasher, content)
+        keys.append(hasher.hexdigest(_DIGEST_BYTES))
+    return keys
+
+
+@lru_cache(maxsize=256)
+def _call_type_bytes(call_type: str) -> bytes:
+    # The handful of call types repeat on every key, so encode each one once
+    return call_type.encode("utf-8")
+
+
+def _key_hasher(call_type: str, parts) -> blake3.blake3:
+    # BLAKE3 can spread MB-scale inputs (flowchart images) across cores
+    parallel = any(
+        isinstance(part, bytes) and len(part) >= _PARALLEL_HASH_BYTES
+        for part in parts
+    )
+    return blake3.blake3(
+        _call_type_bytes(call_type),
+        max_threads=blake3.blake3.AUTO if parallel else 1,
+    )
+
+
+def _hash_part(hasher: blake3.blake3, part: str | bytes) -> None:
+    hasher.update(b"\x00")
+    if isinstance(part, bytes):
+        hasher.update(part)
+        return
+    text = str(part)
+    for start in range(0, len(text), _HASH_CHUNK_CHARS):
+        hasher.update(text[start:start + _HASH_CHUNK_CHARS].encode("utf-8"))
+
+
+def record_cache_hit(call_type: str, content_hash: str) -> None:
+    """
+    Buffer a cache hit and wake the flusher thread, starting it on first use.
+    Callers that serve an entry from their own in-memory copy record it here.
+    """
+    global _hit_flusher
+    with _hit_lock:
+        _hit_buffer[(call_type, content_hash)] += 1
+        if _hit_flusher is None or not _hit_flusher.is_alive():
+            _hit_flusher = threading.Thread(target=_flush_hits, name="cache-hit-flusher", daemon=True)
+            _hit_flusher.start()
+    if not _hits_pending.is_set():
+        _hits_pending.set()
+
+
+def _flush_hits() -> None:
+    while True:
+        _hits_pending.wait()
+        # Let hits accumulate so each flush writes a batch
+        time.sleep(HIT_FLUSH_INTERVAL_SECONDS)
+        _hits_pending.clear()
+        flush_hit_counts()
+
+
+def flush_hit_counts() -> None:
+    """Write buffered hit counts to SQLite in a single transaction."""
+    with _hit_lock:
+        items = [(count, *key) for key, count in _hit_buffer.items()]
+        _hit_buffer.clear()
+
+    if not items:
+        return
+    try:
+        conn = _get_connection()
+        with conn:
+            conn.executemany(_HIT_SQL, items)
+    except Exception as e:
+        logger.error("[CACHE ERROR] flush_hit_counts: %s", e)
+
+
+# The flusher is a daemon thread, so write out whatever is pending at shutdown
+atexit.register(flush_hit_counts)
 
 
 def get_cached_response(call_type: str, content_hash: str) -> dict | None:
     """
     Look up a cached response. Returns the parsed JSON result or None.
-    Also increments hit_count on cache hit.
+    Checks the in-process L1 first and falls back to SQLite, populating the L1.
+    Hits are buffered and added to hit_count by the next flush.
+    """
+    entry = get_cached_entry(call_type, content_hash)
+    return entry[0] if entry is not None else None
+
+
+def get_cached_entry(call_type: str, content_hash: str) -> tuple[dict, int] | None:
+    """
+    Like get_cached_response, but returns (response, expires_at) so callers that
+    keep derived objects in memory can expire them with the stored row.
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """SELECT id, response FROM ai_cache 
-                   WHERE call_type = ? AND content_hash = ? AND expires_at > ?""",
-                (call_type, content_hash, datetime.now().isoformat()),
-            )
-            row = cursor.fetchone()
-
-            if row:
-                # Increment hit count
-                cursor.execute(
-                    "UPDATE ai_cache SET hit_count = hit_count + 1 WHERE id = ?",
-                    (row[0],),
-                )
-                conn.commit()
-                print(f"[CACHE HIT] {call_type} (hash: {content_hash[:12]}...)")
-                return json.loads(row[1])
+        key = (call_type, content_hash)
+        with _l1_lock:
+            entry = _l1.get(key)
+        if entry is not None:
+            record_cache_hit(call_type, content_hash)
+            logger.debug("[CACHE HIT] %s (hash: %.12s..., L1)", call_type, content_hash)
+            return entry
+
+        conn = _get_connection()
+        type_id = _call_type_id(conn, call_type)
+        if type_id is None:
+            return None
+        row = conn.execute(
+            _SELECT_SQL, (type_id, content_hash, int(time.time()))
+        ).fetchone()
+
+        if row:
+            entry = (_decode_payload(row[0]), row[1])
+            with _l1_lock:
+                _l1[key] = entry
+            record_cache_hit(call_type, content_hash)
+            logger.debug("[CACHE HIT] %s (hash: %.12s...)", call_type, content_hash)
+            return entry
 
         return None
     except Exception as e:
-        print(f"[CACHE ERROR] get_cached_response: {e}")
+        logger.error("[CACHE ERROR] get_cached_entry: %s", e)
         return None
 
 
-def set_cached_response(call_type: str, content_hash: str, response: dict) -> None:
+def get_cached_responses(pairs: list[tuple[str, str]]) -> dict:
     """
-    Store a Gemini API response in the cache with TTL.
-    Uses INSERT OR REPLACE to handle duplicate keys gracefully.
+    Look up several cached responses at once.
+    Returns {(call_type, content_hash): response} for the keys that hit; misses
+    are left out. L1 hits are served in-process and the remaining keys are
+    fetched from SQLite in a single query per batch.
     """
+    found = {}
     try:
-        expires_at = datetime.now() + timedelta(hours=CACHE_TTL_HOURS)
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """INSERT OR REPLACE INTO ai_cache 
-                   (call_type, content_hash, response, created_at, expires_at, hit_count)
-                   VALUES (?, ?, ?, ?, ?, 0)""",
-                (
-                    call_type,
-                    content_hash,
-                    json.dumps(response),
-                    datetime.now().isoformat(),
-                    expires_at.isoformat(),
-                ),
-            )
-            conn.commit()
-            print(f"[CACHE STORE] {call_type} (hash: {content_hash[:12]}..., TTL: {CACHE_TTL_HOURS}h)")
+        missing = []
+        with _l1_lock:
+            for key in dict.fromkeys(pairs):
+                entry = _l1.get(key)
+                if entry is not None:
+                    found[key] = entry[0]
+                else:
+                    missing.append(key)
+
+        now = int(time.time())
+        conn = _get_connection()
+        # Unknown call types have never been stored, so those keys are misses
+        type_ids = {}
+        for call_type in {key[0] for key in missing}:
+            type_id = _call_type_id(conn, call_type)
+            if type_id is not None:
+                type_ids[call_type] = type_id
+        names = {type_id: call_type for call_type, type_id in type_ids.items()}
+        missing = [key for key in missing if key[0] in type_ids]
+
+        for start in range(0, len(missing), _BATCH_SIZE):
+            batch = missing[start:start + _BATCH_SIZE]
+            sql = _BATCH_SELECT_SQL.format(values=", ".join(["(?, ?)"] * len(batch)))
+            params = [part for call_type, content_hash in batch for part in (type_ids[call_type], content_hash)]
+            params.append(now)
+            for type_id, content_hash, blob, expires_at in conn.execute(sql, params):
+                response = _decode_payload(blob)
+                key = (names[type_id], content_hash)
+                with _l1_lock:
+                    _l1[key] = (response, expires_at)
+                found[key] = response
+
+        for call_type, content_hash in found:
+            record_cache_hit(call_type, content_hash)
+        if found:
+            logger.debug("[CACHE HIT] %d of %d batched keys", len(found), len(pairs))
+        return found
+    except Exception as e:
+        logger.error("[CACHE ERROR] get_cached_responses: %s", e)
+        return found
+
+
+def set_cached_response(call_type: str, content_hash: str, response: dict) -> int | None:
+    """
+    Store a Gemini API response in the cache with TTL, as (zstd-compressed) JSON.
+    Writes through to the L1. The body is stored once per distinct response and
+    the key row points at it; INSERT OR REPLACE handles duplicate keys gracefully.
+    Returns the entry's expires_at, or None if it could not be stored.
+    """
+    try:
+        now = int(time.time())
+        expires_at = now + CACHE_TTL_SECONDS
+        with _l1_lock:
+            _l1[(call_type, content_hash)] = (response, expires_at)
+        body_hash, body = _encode_payload(response)
+        conn = _get_connection()
+        with conn:
+            conn.execute(_INSERT_BODY_SQL, (body_hash, body))
+            type_id = _call_type_id(conn, call_type, create=True)
+            old = conn.execute(_OLD_BODY_SQL, (type_id, content_hash)).fetchone()
+            conn.execute(_INSERT_SQL, (type_id, content_hash, body_hash, now, expires_at))
+            # Overwriting a key with a different response can orphan its old body
+            if old is not None and old[0] != body_hash:
+                conn.execute(_DELETE_ORPHAN_BODY_SQL, (old[0], old[0]))
+        _call_type_ids[(database.DB_FILE, call_type)] = type_id
+        logger.debug("[CACHE STORE] %s (hash: %.12s..., TTL: %dh)", call_type, content_hash, CACHE_TTL_HOURS)
+        return expires_at
     except Exception as e:
-        print(f"[CACHE ERROR] set_cached_response: {e}")
+        logger.error("[CACHE ERROR] set_cached_response: %s", e)
+        return None
+
+
+def warm_l1_cache(limit: int = L1_CACHE_SIZE) -> int:
+    """
+    Load the most recently stored live entries into the L1, so hits after a
+    restart are served from memory. SQLite stays the durable, shared store.
+    Returns the number of entries loaded.
+    """
+    try:
+        rows = _get_connection().execute(_WARM_SQL, (int(time.time()), limit)).fetchall()
+        # Insert oldest first so the newest entries are the last to be evicted
+        entries = [
+            ((call_type, content_hash), (_decode_payload(body), expires_at))
+            for call_type, content_hash, body, expires_at in reversed(rows)
+        ]
+        with _l1_lock:
+            for key, entry in entries:
+                _l1[key] = entry
+        if entries:
+            logger.info("[CACHE WARM] Loaded %d entries into the L1", len(entries))
+        return len(entries)
+    except Exception as e:
+        logger.error("[CACHE ERROR] warm_l1_cache: %s", e)
+        return 0
 
 
 def get_cache_stats() -> dict:
     """Get cache statistics for the admin endpoint."""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
+        flush_hit_counts()
+        # Per call type: all rows, active rows, all hits, active hits -- one scan
+        rows = _get_connection().execute(
+            _STATS_SQL, (int(time.time()),) * 2
+        ).fetchall()
 
-            # Total entries
-            cursor.execute("SELECT COUNT(*) FROM ai_cache")
-            total_entries = cursor.fetchone()[0]
+        total_entries = sum(r[1] for r in rows)
+        active_entries = sum(r[2] for r in rows)
+        total_hits = sum(r[3] for r in rows)
 
-            # Active (non-expired) entries
-            cursor.execute(
-                "SELECT COUNT(*) FROM ai_cache WHERE expires_at > ?",
-                (datetime.now().isoformat(),),
-            )
-            active_entries = cursor.fetchone()[0]
-
-            # Total hits
-            cursor.execute("SELECT COALESCE(SUM(hit_count), 0) FROM ai_cache")
-            total_hits = cursor.fetchone()[0]
-
-            # Hits by call type
-            cursor.execute(
-                """SELECT call_type, COUNT(*) as entries, COALESCE(SUM(hit_count), 0) as hits
-                   FROM ai_cache WHERE expires_at > ?
-                   GROUP BY call_type ORDER BY hits DESC""",
-                (datetime.now().isoformat(),),
-            )
-            by_type = [
-                {"call_type": r[0], "entries": r[1], "hits": r[2]}
-                for r in cursor.fetchall()
-            ]
+        # Hits by call type (active entries only)
+        by_type = [
+            {"call_type": r[0], "entries": r[2], "hits": r[4]}
+            for r in sorted(rows, key=lambda r: r[4], reverse=True)
+            if r[2]
+        ]
 
-            return {
-                "total_entries": total_entries,
-                "active_entries": active_entries,
-                "expired_entries": total_entries - active_entries,
-                "total_cache_hits": total_hits,
-                "ttl_hours": CACHE_TTL_HOURS,
-                "by_call_type": by_type,
-            }
+        return {
+            "total_entries": total_entries,
+            "active_entries": active_entries,
+            "expired_entries": total_entries - active_entries,
+            "total_cache_hits": total_hits,
+            "ttl_hours": CACHE_TTL_HOURS,
+            "by_call_type": by_type,
+        }
     except Exception as e:
-        print(f"[CACHE ERROR] get_cache_stats: {e}")
+        logger.error("[CACHE ERROR] get_cache_stats: %s", e)
         return {"error": str(e)}
 
 
 def cleanup_expired_cache() -> int:
     """Remove expired cache entries. Returns number of entries removed."""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM ai_cache WHERE expires_at <= ?",
-                (datetime.now().isoformat(),),
+        flush_hit_counts()
+        with _l1_lock:
+            _l1.expire()
+        conn = _get_connection()
+        with conn:
+            body_hashes = [
+                row[0] for row in conn.execute(_DELETE_EXPIRED_SQL, (int(time.time()),))
+            ]
+            conn.executemany(
+                _DELETE_ORPHAN_BODY_SQL, ((body_hash, body_hash) for body_hash in set(body_hashes))
             )
-            removed = cursor.rowcount
-            conn.commit()
-            if removed > 0:
-                print(f"[CACHE CLEANUP] Removed {removed} expired entries")
-            return removed
+        removed = len(body_hashes)
+        if removed > 0:
+            logger.info("[CACHE CLEANUP] Removed %d expired entries", removed)
+        return removed
     except Exception as e:
-        print(f"[CACHE ERROR] cleanup_expired_cache: {e}")
+        logger.error("[CACHE ERROR] cleanup_expired_cache: %s", e)
         return 0
+
+
+def _reap_expired(interval: int) -> None:
+    while True:
+        time.sleep(interval)
+        cleanup_expired_cache()
+        try:
+            # Fold the WAL back into the database so it doesn't grow between
+            # the app's own checkpoints; PASSIVE never blocks other connections
+            _get_connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
+        except Exception as e:
+            logger.error("[CACHE ERROR] wal_checkpoint: %s", e)
+
+
+def start_cache_reaper(interval: int = CACHE_REAP_INTERVAL_SECONDS) -> None:
+    """
+    Start the daemon thread that removes expired entries every `interval` seconds,
+    so dead rows don't pile up between manual cleanups. Safe to call repeatedly.
+    """
+    global _reaper
+    if interval <= 0:
+        return
+    with _reaper_lock:
+        if _reaper is not None and _reaper.is_alive():
+            return
+        _reaper = threading.Thread(
+            target=_reap_expired, args=(interval,), name="cache-reaper", daemon=True
+        )
+        _reaper.start()
@@ -3,13 +3,27 @@ import bcrypt
 import secrets
 import hashlib
 import difflib
-import json
-from datetime import datetime, timedelta
+import orjson
+import time
 from typing import Optional, Tuple
 from contextlib import contextmanager
 
 DB_FILE = "users.db"
 
+# Sessions last 7 days; expires_at is stored as unix epoch seconds
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+
+# Expected ai_cache layout; an older table is dropped and rebuilt on startup
+AI_CACHE_COLUMNS = {
+    "id": "INTEGER",
+    "call_type_id": "INTEGER",
+    "content_hash": "TEXT",
+    "body_hash": "TEXT",
+    "created_at": "INTEGER",
+    "expires_at": "INTEGER",
+    "hit_count": "INTEGER",
+}
+
 
 @contextmanager
 def get_db_connection():
@@ -58,6 +72,13 @@ def init_database():
             )
         """)
 
+        # Sessions used to store expires_at as a local datetime string; convert
+        # those rows to epoch seconds so the integer comparison applies to them
+        cursor.execute(
+            """UPDATE sessions SET expires_at = CAST(strftime('%s', expires_at, 'utc') AS INTEGER)
+               WHERE typeof(expires_at) = 'text'"""
+        )
+
         # Create evaluations table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS evaluations (
@@ -129,22 +150,56 @@ def init_database():
             )
         """)
 
-        # Create AI response cache table
+        # The AI cache only holds regenerable Gemini responses, so a table
+        # from an older schema is simply dropped rather than migrated
+        cursor.execute("PRAGMA table_info(ai_cache)")
+        cache_columns = {row[1]: row[2] for row in cursor.fetchall()}
+        if cache_columns and cache_columns != AI_CACHE_COLUMNS:
+            cursor.execute("DROP TABLE ai_cache")
+            cursor.execute("DROP TABLE IF EXISTS ai_cache_body")
+            cursor.execute("DROP TABLE IF EXISTS ai_call_type")
+
+        # Create AI response cache tables: keys (unix epoch timestamps) point at
+        # content-addressed bodies (orjson BLOBs, zstd-compressed when large)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ai_cache_body (
+                body_hash TEXT PRIMARY KEY,
+                body BLOB NOT NULL
+            )
+        """)
+
+        # Call type names are interned; cache rows reference them by integer id
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ai_call_type (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        """)
+
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS ai_cache (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                call_type TEXT NOT NULL,
+                call_type_id INTEGER NOT NULL REFERENCES ai_call_type(id),
                 content_hash TEXT NOT NULL,
-                response TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP NOT NULL,
+                body_hash TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
                 hit_count INTEGER DEFAULT 0,
-                UNIQUE(call_type, content_hash)
+                UNIQUE(call_type_id, content_hash)
             )
         """)
 
+        # Lookups are served by the UNIQUE(call_type_id, content_hash) autoindex; the
+        # old idx_cache_lookup duplicated it and only added write cost
+        cursor.execute("DROP INDEX IF EXISTS idx_cache_lookup")
+        # Lets cleanup find bodies that no key points at any more
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_body ON ai_cache(body_hash)"
+        )
+
+        # Covering index for the grouped cache stats query (index-only scan)
         cursor.execute(
-            "CREATE INDEX IF NOT EXISTS idx_cache_lookup ON ai_cache(call_type, content_hash)"
+            "CREATE INDEX IF NOT EXISTS idx_cache_stats ON ai_cache(call_type_id, expires_at, hit_count)"
         )
 
         conn.commit()
@@ -202,7 +257,7 @@ def create_session(user_id: int) -> str:
         cursor = conn.cursor()
 
         token = secrets.token_urlsafe(32)
-        expires_at = datetime.now() + timedelta(days=7)
+        expires_at = int(time.time()) + SESSION_TTL_SECONDS
 
         cursor.execute(
             "INSERT INTO sessions (user_id, token, expires_at) VALUES (?, ?, ?)",
@@ -221,7 +276,7 @@ def verify_session(token: str) -> Optional[int]:
 
         cursor.execute(
             "SELECT user_id FROM sessions WHERE token = ? AND expires_at > ?",
-            (token, datetime.now()),
+            (token, int(time.time())),
         )
 
         result = cursor.fetchone()
@@ -265,7 +320,7 @@ def save_evaluation(user_id: int, eval_type: str, content: str, result: dict) ->
                     user_id,
                     eval_type,
                     content,
-                    json.dumps(result),
+                    orjson.dumps(result).decode(),
                     result.get("total_score", 0),
                 ),
             )
@@ -294,7 +349,7 @@ def get_user_evaluations(user_id: int, limit: int = 10):
                         "id": row[0],
                         "type": row[1],
                         "content": row[2],
-                        "result": json.loads(row[3]),
+                        "result": orjson.loads(row[3]),
                         "total_score": row[4],
                         "created_at": row[5],
                     }
@@ -334,9 +389,9 @@ def save_comparison(
                     solution2_content[:1000],
                     cfg1_json,
                     cfg2_json,
-                    json.dumps(comparison_result),
+                    orjson.dumps(comparison_result).decode(),
                     winner,
-                    json.dumps(overall_scores),
+                    orjson.dumps(overall_scores).decode(),
                 ),
             )
             comp_id = cursor.lastrowid
@@ -368,8 +423,8 @@ def get_user_comparisons(user_id: int, limit: int = 20):
                         "solution1_type": row[2],
                         "solution2_type": row[3],
                         "winner": row[4],
-                        "overall_scores": json.loads(row[5]),
-                        "comparison_result": json.loads(row[6]),
+                        "overall_scores": orjson.loads(row[5]),
+                        "comparison_result": orjson.loads(row[6]),
                         "created_at": row[7],
                     }
                 )
@@ -401,11 +456,11 @@ def get_comparison_by_id(comparison_id: int, user_id: int):
                 "solution1_content": row[3],
                 "solution2_type": row[4],
                 "solution2_content": row[5],
-                "cfg1_json": json.loads(row[6]),
-                "cfg2_json": json.loads(row[7]),
-                "comparison_result": json.loads(row[8]),
+                "cfg1_json": orjson.loads(row[6]),
+                "cfg2_json": orjson.loads(row[7]),
+                "comparison_result": orjson.loads(row[8]),
                 "winner": row[9],
-                "overall_scores": json.loads(row[10]),
+                "overall_scores": orjson.loads(row[10]),
                 "created_at": row[11],
             }
     except Exception:
@@ -462,7 +517,7 @@ def find_similar_problem(statement: str, threshold: float = 0.85):
                 "id": best_match[0],
                 "problem_statement": best_match[1],
                 "problem_hash": best_match[2],
-                "bottom_line_cfg": json.loads(best_match[3]) if best_match[3] else None,
+                "bottom_line_cfg": orjson.loads(best_match[3]) if best_match[3] else None,
                 "similarity_score": best_score,
             }
         return None
@@ -502,7 +557,7 @@ def update_problem_cfg(
                optimal_space_complexity = ?, problem_category = ?, updated_at = CURRENT_TIMESTAMP 
                WHERE id = ?""",
             (
-                json.dumps(bottom_line_cfg),
+                orjson.dumps(bottom_line_cfg).decode(),
                 time_complexity,
                 space_complexity,
                 category,
@@ -525,7 +580,7 @@ def get_problem_by_id(problem_id: int):
             return {
                 "id": row[0],
                 "problem_statement": row[1],
-                "bottom_line_cfg": json.loads(row[2]) if row[2] else None,
+                "bottom_line_cfg": orjson.loads(row[2]) if row[2] else None,
                 "optimal_time_complexity": row[3],
                 "optimal_space_complexity": row[4],
                 "problem_category": row[5],
@@ -554,11 +609,11 @@ def save_solution(
                 problem_id,
                 solution_type,
                 solution_content[:5000],
-                json.dumps(cfg_json),
+                orjson.dumps(cfg_json).decode(),
                 is_reference,
                 user_id,
                 evaluation_score,
-                json.dumps(evaluation_result) if evaluation_result else None,
+                orjson.dumps(evaluation_result).decode() if evaluation_result else None,
             ),
         )
         conn.commit()
@@ -592,7 +647,7 @@ def get_reference_solution(problem_id: int):
                 "id": row[0],
                 "solution_type": row[1],
                 "solution_content": row[2],
-                "cfg_json": json.loads(row[3]),
+                "cfg_json": orjson.loads(row[3]),
             }
         return None
 
@@ -1,9 +1,12 @@
+import logging
 import google.generativeai as genai
 import os
-import json
+import orjson
 from dotenv import load_dotenv
 from cache import generate_cache_key, get_cached_response, set_cached_response, normalize_code
 
+logger = logging.getLogger(__name__)
+
 load_dotenv(override=True)
 api_key = os.getenv("GOOGLE_API_KEY")
 print(f"Algorithm API Key loaded: {'YES' if api_key else 'NO'}")
@@ -131,12 +134,13 @@ CRITICAL: Return ONLY the JSON object. No markdown, no code blocks, no explanato
     model = genai.GenerativeModel("gemini-2.5-flash")
     prompt = f"{system_prompt}\n\nEvaluate this {eval_type}:\n\n{text}"
     response = model.generate_content(prompt)
-    print("Raw response:", response.text)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw response: %s", response.text)
     
     # Clean the response
     cleaned_text = response.text.strip()
     cleaned_text = cleaned_text.replace('```json', '').replace('```', '')
-    result = json.loads(cleaned_text)
+    result = orjson.loads(cleaned_text)
 
     # Store in cache
     set_cached_response("evaluate_algorithm", cache_key, result)
@@ -1,12 +1,15 @@
+import logging
 import google.generativeai as genai
 import os
-import json
-import base64
+import orjson
 from PIL import Image
 from io import BytesIO
 from dotenv import load_dotenv
+from uploads import decode_base64_upload
 from cache import generate_cache_key, get_cached_response, set_cached_response
 
+logger = logging.getLogger(__name__)
+
 load_dotenv(override=True)
 api_key = os.getenv("GOOGLE_API_KEY")
 print(f"Flowchart API Key loaded: {'YES' if api_key else 'NO'}")
@@ -125,16 +128,16 @@ Critical: Return ONLY the JSON object with no surrounding text, markdown code bl
 """
 
     # Decode base64 image
-    image_data = base64_image.split(',')[1] if ',' in base64_image else base64_image
-    image_bytes = base64.b64decode(image_data)
+    image_bytes = decode_base64_upload(base64_image)
     image = Image.open(BytesIO(image_bytes))
 
     model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
     model = genai.GenerativeModel(model_name)
     prompt = f"{system_prompt}\n\nEvaluate this flowchart based on the rubrics. Provide detailed scoring and feedback."
     response = model.generate_content([prompt, image])
-    print("Raw response:", response.text)
-    result = json.loads(response.text.strip().replace('```json', '').replace('```', ''))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw response: %s", response.text)
+    result = orjson.loads(response.text.strip().replace('```json', '').replace('```', ''))
 
     # Store in cache
     set_cached_response("evaluate_flowchart", cache_key, result)
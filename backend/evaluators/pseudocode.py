@@ -1,9 +1,12 @@
+import logging
 import google.generativeai as genai
 import os
-import json
+import orjson
 from dotenv import load_dotenv
 from cache import generate_cache_key, get_cached_response, set_cached_response, normalize_code
 
+logger = logging.getLogger(__name__)
+
 load_dotenv(override=True)
 api_key = os.getenv("GOOGLE_API_KEY")
 print(f"Pseudocode API Key loaded: {'YES' if api_key else 'NO'}")
@@ -100,8 +103,9 @@ Important: Return ONLY the JSON object. Do not include any text before or after
     model = genai.GenerativeModel("gemini-2.5-flash-lite")
     prompt = f"{system_prompt}\n\nEvaluate this pseudocode based on the rubrics:\n\n{code}"
     response = model.generate_content(prompt)
-    print("Raw response:", response.text)
-    result = json.loads(response.text.strip().replace('```json', '').replace('```', ''))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw response: %s", response.text)
+    result = orjson.loads(response.text.strip().replace('```json', '').replace('```', ''))
 
     # Store in cache
     set_cached_response("evaluate_pseudocode", cache_key, result)
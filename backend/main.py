@@ -5,7 +5,9 @@ from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import Optional
 import base64
-import json
+import orjson
+import logging
+import os
 from evaluators.flowchart import evaluate_flowchart
 from evaluators.pseudocode import evaluate_pseudocode
 from evaluators.algorithm import evaluate_algorithm
@@ -37,16 +39,33 @@ from database import (
     get_db_connection,
     search_problems,
 )
-from analyzers.cfg_generator import pseudocode_to_cfg, flowchart_to_cfg, cfg_to_dict
+from analyzers.cfg_generator import (
+    pseudocode_to_cfg,
+    flowchart_to_cfg,
+    flowchart_to_cfg_bytes,
+    cfg_to_dict,
+)
 from analyzers.problem_analyzer import analyze_problem
 from analyzers.cfg_comparator import compare_cfgs
 from analyzers.cfg_visualizer import cfg_to_mermaid
 from analyzers.cfg_canonicalizer import canonicalize_cfg, calculate_cfg_similarity
 from analyzers.solution_validator import validate_solution_relevance
-from cache import get_cache_stats, cleanup_expired_cache
+from cache import get_cache_stats, cleanup_expired_cache, start_cache_reaper, warm_l1_cache
+
+# Analyzer and cache diagnostics go through `logging`; set LOG_LEVEL=DEBUG to see
+# raw Gemini responses and cache hits
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
 
 app = FastAPI()
 
+# Serve recent AI cache entries from memory straight away, and prune expired
+# ones in the background
+warm_l1_cache()
+start_cache_reaper()
+
 # Enable CORS for local React app
 app.add_middleware(
     CORSMiddleware,
@@ -380,8 +399,8 @@ async def api_compare_solutions(
             solution1_content=request.solution1.content,
             solution2_type=request.solution2.type,
             solution2_content=request.solution2.content,
-            cfg1_json=json.dumps(cfg1_dict),
-            cfg2_json=json.dumps(cfg2_dict),
+            cfg1_json=orjson.dumps(cfg1_dict).decode(),
+            cfg2_json=orjson.dumps(cfg2_dict).decode(),
             comparison_result=comparison_result,
             winner=comparison_result["winner"],
             overall_scores=overall_scores,
@@ -562,6 +581,7 @@ async def api_upload_reference(
             raise HTTPException(status_code=404, detail="Problem not found")
 
         solution_content = request.solution_content
+        pdf_image = None  # (image_bytes, mime_type) extracted from a PDF
 
         # Handle PDF content
         if request.content_format == "pdf":
@@ -586,9 +606,19 @@ async def api_upload_reference(
                     status_code=400,
                     detail="PDF contains text but flowchart mode was selected. Please upload a PDF with flowchart images or switch to pseudocode mode.",
                 )
+            if pdf_result["content_type"] == "image":
+                if request.solution_type != "flowchart":
+                    raise HTTPException(
+                        status_code=400,
+                        detail="PDF contains no readable text but pseudocode mode was selected. Please upload a PDF with text or switch to flowchart mode.",
+                    )
+                # Hand the extracted image bytes straight to Gemini
+                pdf_image = (pdf_result["content"], pdf_result["mime_type"])
 
         # Generate CFG
-        if request.solution_type == "flowchart":
+        if pdf_image is not None:
+            cfg = await flowchart_to_cfg_bytes(*pdf_image)
+        elif request.solution_type == "flowchart":
             cfg = await flowchart_to_cfg(solution_content)
         else:
             cfg = await pseudocode_to_cfg(solution_content)
@@ -653,6 +683,7 @@ async def api_evaluate_solution(
             )
 
         solution_content = request.solution_content
+        pdf_image = None  # (image_bytes, mime_type) extracted from a PDF
 
         # Handle PDF content
         if request.content_format == "pdf":
@@ -677,9 +708,19 @@ async def api_evaluate_solution(
                     status_code=400,
                     detail="PDF contains text but flowchart mode was selected. Please upload a PDF with flowchart images or switch to pseudocode mode.",
                 )
+            if pdf_result["content_type"] == "image":
+                if request.solution_type != "flowchart":
+                    raise HTTPException(
+                        status_code=400,
+                        detail="PDF contains no readable text but pseudocode mode was selected. Please upload a PDF with text or switch to flowchart mode.",
+                    )
+                # Hand the extracted image bytes straight to Gemini
+                pdf_image = (pdf_result["content"], pdf_result["mime_type"])
 
         # Generate CFG from user solution
-        if request.solution_type == "flowchart":
+        if pdf_image is not None:
+            user_cfg = await flowchart_to_cfg_bytes(*pdf_image)
+        elif request.solution_type == "flowchart":
             user_cfg = await flowchart_to_cfg(solution_content)
         else:
             user_cfg = await pseudocode_to_cfg(solution_content)
@@ -863,9 +904,9 @@ async def api_evaluate_solution(
                     "UPDATE solutions SET solution_content = ?, cfg_json = ?, evaluation_score = ?, evaluation_result = ? WHERE id = ?",
                     (
                         request.solution_content[:5000],
-                        json.dumps(user_cfg_dict),
+                        orjson.dumps(user_cfg_dict).decode(),
                         evaluation["total_score"],
-                        json.dumps(evaluation),
+                        orjson.dumps(evaluation).decode(),
                         existing_solution[0],
                     ),
                 )
@@ -4,13 +4,16 @@ Supports: .docx, .pptx, .pdf, .txt
 Also supports extracting images from PDFs for flowchart processing
 """
 
+import logging
 import io
-import base64
+import asyncio
 from typing import Dict, Any, Tuple, Optional
 from docx import Document
 from pptx import Presentation
-from PyPDF2 import PdfReader
-import fitz  # pymupdf for image extraction
+import fitz  # pymupdf for text and image extraction
+from uploads import decode_base64_upload
+
+logger = logging.getLogger(__name__)
 
 
 async def parse_document(file_base64: str, file_type: str) -> Dict[str, Any]:
@@ -26,9 +29,7 @@ async def parse_document(file_base64: str, file_type: str) -> Dict[str, Any]:
     """
     try:
         # Decode base64 content
-        file_content = base64.b64decode(
-            file_base64.split(",")[1] if "," in file_base64 else file_base64
-        )
+        file_content = decode_base64_upload(file_base64)
         file_stream = io.BytesIO(file_content)
 
         extracted_text = ""
@@ -49,14 +50,20 @@ async def parse_document(file_base64: str, file_type: str) -> Dict[str, Any]:
         return {"text": extracted_text, "metadata": metadata, "success": True}
 
     except Exception as e:
-        print(f"Error parsing document: {str(e)}")
+        logger.exception("Error parsing document")
         return {"text": "", "metadata": {}, "success": False, "error": str(e)}
 
 
 async def parse_docx(file_stream: io.BytesIO) -> Tuple[str, Dict[str, Any]]:
     """Parse DOCX file and extract text"""
     doc = Document(file_stream)
-    paragraphs = [para.text for para in doc.paragraphs if para.text.strip()]
+
+    # para.text re-walks the paragraph's runs on every access, so read it once
+    paragraphs = []
+    for para in doc.paragraphs:
+        para_text = para.text
+        if para_text and not para_text.isspace():
+            paragraphs.append(para_text)
     text = "\n\n".join(paragraphs)
 
     metadata = {
@@ -70,14 +77,23 @@ async def parse_docx(file_stream: io.BytesIO) -> Tuple[str, Dict[str, Any]]:
 
 async def parse_pptx(file_stream: io.BytesIO) -> Tuple[str, Dict[str, Any]]:
     """Parse PPTX file and extract text from slides"""
+    # python-pptx walks the slide XML synchronously; keep it off the event loop
+    return await asyncio.to_thread(_extract_pptx_text, file_stream)
+
+
+def _extract_pptx_text(file_stream: io.BytesIO) -> Tuple[str, Dict[str, Any]]:
     prs = Presentation(file_stream)
     slide_texts = []
 
     for i, slide in enumerate(prs.slides):
         slide_content = []
         for shape in slide.shapes:
-            if hasattr(shape, "text") and shape.text.strip():
-                slide_content.append(shape.text)
+            if not shape.has_text_frame:
+                continue
+            # Each .text access rebuilds the string from the XML, so read it once
+            shape_text = shape.text_frame.text
+            if shape_text.strip():
+                slide_content.append(shape_text)
         if slide_content:
             slide_texts.append(f"Slide {i + 1}:\n" + "\n".join(slide_content))
 
@@ -90,25 +106,88 @@ async def parse_pptx(file_stream: io.BytesIO) -> Tuple[str, Dict[str, Any]]:
 
 async def parse_pdf(file_stream: io.BytesIO) -> Tuple[str, Dict[str, Any]]:
     """Parse PDF file and extract text"""
-    pdf_reader = PdfReader(file_stream)
+    # pymupdf extracts in C but still blocks, so keep it off the event loop.
+    # A fitz.Document is not thread-safe, so pages are read in a single worker.
+    return await asyncio.to_thread(_parse_pdf_text, file_stream.getvalue())
+
+
+def _parse_pdf_text(file_content: bytes) -> Tuple[str, Dict[str, Any]]:
+    with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+        text, metadata, _ = _extract_pdf_text(pdf_document)
+    return text, metadata
+
+
+def _extract_pdf_text(pdf_document: fitz.Document) -> Tuple[str, Dict[str, Any], int]:
+    """
+    Extract per-page text from an open PDF.
+    Also returns the total length of the stripped page texts so callers can
+    judge whether the PDF has meaningful text without a second pass.
+    """
     page_texts = []
+    text_length = 0
 
-    for i, page in enumerate(pdf_reader.pages):
-        page_text = page.extract_text()
-        if page_text.strip():
+    for i, page in enumerate(pdf_document):
+        page_text = page.get_text()
+        stripped_length = len(page_text.strip())
+        if stripped_length:
+            text_length += stripped_length
             page_texts.append(f"Page {i + 1}:\n{page_text}")
 
     text = "\n\n".join(page_texts)
 
-    metadata = {"type": ".pdf", "pages": len(pdf_reader.pages)}
+    metadata = {"type": ".pdf", "pages": len(pdf_document)}
 
-    return text, metadata
+    return text, metadata, text_length
+
+
+def _find_best_image(pdf_document: fitz.Document) -> Optional[Tuple[bytes, str]]:
+    """
+    Find the largest image in an open PDF and return (image_bytes, mime_type).
+
+    Embedded images are ranked by the pixel dimensions reported by
+    get_images(), and pages without embedded images by the size they would
+    render at, so only the winning image is ever extracted or rendered.
+    """
+    best_xref = None
+    best_page = None
+    best_area = 0
+
+    for page in pdf_document:
+        # Try embedded images first
+        image_list = page.get_images(full=True)
+
+        for img_info in image_list:
+            area = img_info[2] * img_info[3]  # width * height
+            if area > best_area:
+                best_area = area
+                best_xref, best_page = img_info[0], None
+
+        # If no embedded images, the page itself would be rendered at 2x
+        if not image_list:
+            area = page.rect.width * page.rect.height * 4
+            if area > best_area:
+                best_area = area
+                best_xref, best_page = None, page.number
+
+    if best_xref is not None:
+        base_image = pdf_document.extract_image(best_xref)
+        img_ext = base_image["ext"]
+        mime_type = f"image/{img_ext}" if img_ext != "jpg" else "image/jpeg"
+        return base_image["image"], mime_type
+
+    if best_page is not None:
+        # Render page at 2x resolution for better quality
+        pix = pdf_document[best_page].get_pixmap(matrix=fitz.Matrix(2, 2))
+        return pix.tobytes("png"), "image/png"
+
+    return None
 
 
 async def parse_pdf_for_images(file_base64: str) -> Dict[str, Any]:
     """
     Extract images from PDF file for flowchart processing.
-    Returns the first/largest image found as base64.
+    Returns the largest image found as raw bytes plus its MIME type; callers
+    only base64-encode it if it has to leave the process.
 
     Args:
         file_base64: Base64 encoded PDF file
@@ -118,64 +197,25 @@ async def parse_pdf_for_images(file_base64: str) -> Dict[str, Any]:
     """
     try:
         # Decode base64 content
-        file_content = base64.b64decode(
-            file_base64.split(",")[1] if "," in file_base64 else file_base64
-        )
+        file_content = decode_base64_upload(file_base64)
 
         # Open PDF with pymupdf
-        pdf_document = fitz.open(stream=file_content, filetype="pdf")
-
-        best_image = None
-        best_image_size = 0
-
-        for page_num in range(len(pdf_document)):
-            page = pdf_document[page_num]
-
-            # Try to extract embedded images first
-            image_list = page.get_images(full=True)
-
-            for img_index, img_info in enumerate(image_list):
-                xref = img_info[0]
-                base_image = pdf_document.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_size = len(image_bytes)
-
-                # Keep track of the largest image
-                if image_size > best_image_size:
-                    best_image_size = image_size
-                    # Convert to base64 with proper data URI
-                    img_ext = base_image["ext"]
-                    mime_type = f"image/{img_ext}" if img_ext != "jpg" else "image/jpeg"
-                    best_image = f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
-
-            # If no embedded images, render the page as an image
-            if not image_list:
-                # Render page at 2x resolution for better quality
-                mat = fitz.Matrix(2, 2)
-                pix = page.get_pixmap(matrix=mat)
-                image_bytes = pix.tobytes("png")
-                image_size = len(image_bytes)
-
-                if image_size > best_image_size:
-                    best_image_size = image_size
-                    best_image = f"data:image/png;base64,{base64.b64encode(image_bytes).decode('utf-8')}"
-
-        pdf_document.close()
+        with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+            best_image = _find_best_image(pdf_document)
 
         if best_image:
+            image_bytes, mime_type = best_image
             return {
                 "success": True,
-                "image_base64": best_image,
-                "image_size": best_image_size,
+                "image_bytes": image_bytes,
+                "mime_type": mime_type,
+                "image_size": len(image_bytes),
             }
         else:
             return {"success": False, "error": "No images found in PDF"}
 
     except Exception as e:
-        print(f"Error extracting images from PDF: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error extracting images from PDF")
         return {"success": False, "error": str(e)}
 
 
@@ -184,100 +224,53 @@ async def parse_pdf_smart(
 ) -> Dict[str, Any]:
     """
     Smart PDF parser that detects content type and extracts accordingly.
+    The PDF is decoded and opened once; text and image extraction share it.
 
     Args:
         file_base64: Base64 encoded PDF file
         prefer_image: If True, try to extract images first (for flowchart mode)
 
     Returns:
-        Dictionary with either text content or image data
+        Dictionary with either text content or raw image bytes and mime_type
     """
     try:
         # Decode base64 content
-        file_content = base64.b64decode(
-            file_base64.split(",")[1] if "," in file_base64 else file_base64
-        )
-
-        # Open PDF with pymupdf to check content
-        pdf_document = fitz.open(stream=file_content, filetype="pdf")
-
-        has_images = False
-        has_significant_text = False
-        total_text_length = 0
-        total_image_area = 0
-
-        for page_num in range(len(pdf_document)):
-            page = pdf_document[page_num]
-
-            # Check for images
-            image_list = page.get_images(full=True)
-            if image_list:
-                has_images = True
-                for img_info in image_list:
-                    # Estimate image area from image dimensions
-                    xref = img_info[0]
-                    try:
-                        base_image = pdf_document.extract_image(xref)
-                        total_image_area += len(base_image["image"])
-                    except:
-                        pass
-
-            # Check for text
-            text = page.get_text()
-            total_text_length += len(text.strip())
-
-        pdf_document.close()
-
-        # Determine content type based on preferences and content analysis
-        if prefer_image:
+        file_content = decode_base64_upload(file_base64)
+
+        with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
             # In flowchart mode, always try to get images
-            image_result = await parse_pdf_for_images(file_base64)
-            if image_result["success"]:
+            if prefer_image:
+                best_image = _find_best_image(pdf_document)
+                if best_image:
+                    return {
+                        "success": True,
+                        "content_type": "image",
+                        "content": best_image[0],
+                        "mime_type": best_image[1],
+                    }
+
+            # If we have significant text (more than 50 chars), extract as text
+            text, metadata, text_length = _extract_pdf_text(pdf_document)
+            if text_length > 50:
                 return {
                     "success": True,
-                    "content_type": "image",
-                    "content": image_result["image_base64"],
+                    "content_type": "text",
+                    "content": text,
+                    "metadata": metadata,
                 }
 
-        # If we have significant text (more than 50 chars), extract as text
-        if total_text_length > 50:
-            has_significant_text = True
-
-        # Decision logic
-        if prefer_image and has_images:
-            image_result = await parse_pdf_for_images(file_base64)
-            if image_result["success"]:
+            # Fallback: try to render page as image
+            best_image = None if prefer_image else _find_best_image(pdf_document)
+            if best_image:
                 return {
                     "success": True,
                     "content_type": "image",
-                    "content": image_result["image_base64"],
+                    "content": best_image[0],
+                    "mime_type": best_image[1],
                 }
 
-        if has_significant_text:
-            # Extract text
-            file_stream = io.BytesIO(file_content)
-            text, metadata = await parse_pdf(file_stream)
-            return {
-                "success": True,
-                "content_type": "text",
-                "content": text,
-                "metadata": metadata,
-            }
-
-        # Fallback: try to render page as image
-        image_result = await parse_pdf_for_images(file_base64)
-        if image_result["success"]:
-            return {
-                "success": True,
-                "content_type": "image",
-                "content": image_result["image_base64"],
-            }
-
         return {"success": False, "error": "Could not extract content from PDF"}
 
     except Exception as e:
-        print(f"Error in smart PDF parsing: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error in smart PDF parsing")
         return {"success": False, "error": str(e)}
@@ -1,15 +1,41 @@
 """
 Test for the AI response cache module.
-Run: python test_cache.py (from the backend directory)
+Run: pytest test_cache.py (from the backend directory)
 """
+import sqlite3
 import sys
-import os
 
-# Add backend to path for imports
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import pytest
 
-from database import init_database
-from cache import generate_cache_key, get_cached_response, set_cached_response, get_cache_stats, cleanup_expired_cache
+import cache
+import database
+from cache import (
+    generate_cache_key,
+    generate_cache_keys,
+    get_cached_entry,
+    get_cached_response,
+    get_cached_responses,
+    set_cached_response,
+    get_cache_stats,
+    cleanup_expired_cache,
+)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def db(tmp_path_factory):
+    """Point the cache at a throwaway database shared by the whole session"""
+    original = database.DB_FILE
+    database.DB_FILE = str(tmp_path_factory.mktemp("cache") / "test_cache.db")
+    database.init_database()
+    yield database.DB_FILE
+    cleanup_expired_cache()
+    database.DB_FILE = original
+
+
+def clear_l1():
+    """Empty the in-process L1 so the next lookup is served from SQLite"""
+    with cache._l1_lock:
+        cache._l1.clear()
 
 
 def test_cache_key_determinism():
@@ -17,10 +43,15 @@ def test_cache_key_determinism():
     key1 = generate_cache_key("evaluate_pseudocode", "def bubble_sort(arr): ...")
     key2 = generate_cache_key("evaluate_pseudocode", "def bubble_sort(arr): ...")
     key3 = generate_cache_key("evaluate_pseudocode", "def quick_sort(arr): ...")
-    
+
     assert key1 == key2, f"Same input produced different keys: {key1} vs {key2}"
     assert key1 != key3, "Different inputs should produce different keys"
-    print("✅ Cache key determinism: PASSED")
+
+    batch = generate_cache_keys("evaluate_pseudocode", ["def bubble_sort(arr): ...", "def quick_sort(arr): ..."])
+    assert batch == [key1, key3], f"Batched keys differ from single keys: {batch}"
+
+    # The one-shot short-text path and the streamed path must agree
+    assert generate_cache_key("evaluate_pseudocode", b"def bubble_sort(arr): ...") == key1
 
 
 def test_cache_miss():
@@ -28,69 +59,171 @@ def test_cache_miss():
     key = generate_cache_key("test_miss", "nonexistent_content_12345")
     result = get_cached_response("test_miss", key)
     assert result is None, f"Expected None for cache miss, got {result}"
-    print("✅ Cache miss: PASSED")
 
 
-def test_cache_store_and_hit():
-    """Stored response should be retrievable"""
-    call_type = "test_store"
-    content = "test_content_for_caching"
-    mock_response = {"total_score": 85, "breakdown": [{"criterion": "Correctness", "score": 42}]}
-    
+@pytest.mark.parametrize(
+    "call_type, content, response",
+    [
+        (
+            "test_store",
+            "test_content_for_caching",
+            {"total_score": 85, "breakdown": [{"criterion": "Correctness", "score": 42}]},
+        ),
+        ("test_store", "unicode_content", {"feedback": "✅ Handles empty input 💡 use a set"}),
+        ("test_store_large", "large_content", {"nodes": [{"id": f"n{i}", "label": "step " * 20} for i in range(50)]}),
+    ],
+)
+def test_cache_store_and_hit(call_type, content, response):
+    """Stored response should be retrievable from SQLite, not just the L1"""
     key = generate_cache_key(call_type, content)
-    set_cached_response(call_type, key, mock_response)
-    
-    # Retrieve it
+    set_cached_response(call_type, key, response)
+    clear_l1()
+
+    cached = get_cached_response(call_type, key)
+    assert cached == response, f"Unexpected cached response: {cached}"
+
+
+def test_large_payload_is_compressed():
+    """Large responses should be stored zstd-compressed and decode on the way back"""
+    call_type = "test_compressed"
+    response = {"nodes": [{"id": f"n{i}", "label": "step " * 20} for i in range(50)]}
+    key = generate_cache_key(call_type, "compressed_content")
+    set_cached_response(call_type, key, response)
+    clear_l1()
+
+    with sqlite3.connect(database.DB_FILE) as conn:
+        (body,) = conn.execute(
+            """SELECT b.body FROM ai_cache c JOIN ai_cache_body b ON b.body_hash = c.body_hash
+               WHERE c.content_hash = ?""",
+            (key,),
+        ).fetchone()
+    assert body[:4] == cache._ZSTD_MAGIC, "Large payload should be stored compressed"
+
     cached = get_cached_response(call_type, key)
-    assert cached is not None, "Cache should return stored response"
-    assert cached["total_score"] == 85, f"Unexpected score: {cached['total_score']}"
-    assert cached["breakdown"][0]["criterion"] == "Correctness"
-    print("✅ Cache store and hit: PASSED")
+    assert cached == response, "Compressed payload did not round-trip through SQLite"
+
+
+def test_l1_serves_decoded_response():
+    """Repeated hits should come from the in-process L1 without re-decoding"""
+    call_type = "test_l1"
+    key = generate_cache_key(call_type, "l1_content")
+    set_cached_response(call_type, key, {"score": 77})
+
+    first = get_cached_response(call_type, key)
+    second = get_cached_response(call_type, key)
+    assert first == {"score": 77}, f"Unexpected L1 response: {first}"
+    assert first is second, "L1 hits should return the already-decoded dict"
+
+
+def test_cached_entry_carries_row_expiry():
+    """get_cached_entry should return the expiry set_cached_response stored"""
+    call_type = "test_entry"
+    key = generate_cache_key(call_type, "entry_content")
+    expires_at = set_cached_response(call_type, key, {"score": 5})
+    assert expires_at is not None, "Store should report the entry's expiry"
+
+    assert get_cached_entry(call_type, key) == ({"score": 5}, expires_at), "L1 entry lost its expiry"
+    clear_l1()
+    assert get_cached_entry(call_type, key) == ({"score": 5}, expires_at), "SQLite entry lost its expiry"
 
 
 def test_cache_stats():
     """Stats should show entries and hits"""
+    key = generate_cache_key("test_stats", "stats_content")
+    set_cached_response("test_stats", key, {"score": 1})
+    get_cached_response("test_stats", key)
+
     stats = get_cache_stats()
     assert "total_entries" in stats, "Stats missing total_entries"
     assert "active_entries" in stats, "Stats missing active_entries"
     assert "total_cache_hits" in stats, "Stats missing total_cache_hits"
-    assert stats["active_entries"] > 0, "Should have at least one active entry from previous test"
-    print(f"✅ Cache stats: PASSED (entries={stats['active_entries']}, hits={stats['total_cache_hits']})")
+    assert stats["active_entries"] > 0, "Should have at least one active entry"
+    assert stats["total_cache_hits"] > 0, "Buffered hits should be flushed before stats"
 
 
 def test_different_call_types():
     """Same content but different call types should have different cache entries"""
     content = "shared_test_content"
-    response_a = {"type": "A", "score": 90}
-    response_b = {"type": "B", "score": 70}
-    
     key_a = generate_cache_key("type_a", content)
     key_b = generate_cache_key("type_b", content)
-    
-    set_cached_response("type_a", key_a, response_a)
-    set_cached_response("type_b", key_b, response_b)
-    
+
+    set_cached_response("type_a", key_a, {"type": "A", "score": 90})
+    set_cached_response("type_b", key_b, {"type": "B", "score": 70})
+
     cached_a = get_cached_response("type_a", key_a)
     cached_b = get_cached_response("type_b", key_b)
-    
+
     assert cached_a["score"] == 90, f"Type A should return 90, got {cached_a['score']}"
     assert cached_b["score"] == 70, f"Type B should return 70, got {cached_b['score']}"
-    print("✅ Different call types isolation: PASSED")
+
+
+def test_rolled_back_store_does_not_cache_call_type_id(monkeypatch):
+    """A failed store must not leave a call type id that a later type reuses"""
+    key_a = generate_cache_key("rollback_a", "rollback_content")
+    key_b = generate_cache_key("rollback_b", "rollback_content")
+
+    monkeypatch.setattr(cache, "_INSERT_SQL", "INSERT INTO missing_table VALUES (?, ?, ?, ?, ?)")
+    assert set_cached_response("rollback_a", key_a, {"score": 1}) is None, "Store should have failed"
+    monkeypatch.undo()
+
+    set_cached_response("rollback_b", key_b, {"score": 2})
+    set_cached_response("rollback_a", key_a, {"score": 3})
+    clear_l1()
+
+    assert get_cached_response("rollback_a", key_a) == {"score": 3}, "rollback_a read another type's row"
+    assert get_cached_response("rollback_b", key_b) == {"score": 2}, "rollback_b read another type's row"
+    by_type = {entry["call_type"]: entry["entries"] for entry in get_cache_stats()["by_call_type"]}
+    assert by_type.get("rollback_a") == 1 and by_type.get("rollback_b") == 1, f"Stats mix call types: {by_type}"
+
+
+def test_orphaned_bodies_are_removed(monkeypatch):
+    """Bodies left without a key row by an overwrite or expiry should be deleted"""
+    def body_count(response):
+        body_hash = cache._encode_payload(response)[0]
+        with sqlite3.connect(database.DB_FILE) as conn:
+            return conn.execute("SELECT COUNT(*) FROM ai_cache_body WHERE body_hash = ?", (body_hash,)).fetchone()[0]
+
+    key = generate_cache_key("test_orphans", "overwritten_content")
+    set_cached_response("test_orphans", key, {"version": 1})
+    set_cached_response("test_orphans", key, {"version": 2})
+    assert body_count({"version": 1}) == 0, "Overwritten body should be deleted"
+    assert body_count({"version": 2}) == 1, "Current body should be kept"
+
+    # An expired row sharing its body with a live one must not take the body with it
+    shared = {"version": "shared"}
+    set_cached_response("test_orphans", generate_cache_key("test_orphans", "live"), shared)
+    monkeypatch.setattr(cache, "CACHE_TTL_SECONDS", -1)
+    set_cached_response("test_orphans", generate_cache_key("test_orphans", "expired"), {"version": 3})
+    set_cached_response("test_orphans", generate_cache_key("test_orphans", "expired_shared"), shared)
+    monkeypatch.undo()
+
+    assert cleanup_expired_cache() >= 2, "Expired rows should be removed"
+    assert body_count({"version": 3}) == 0, "Expired row's body should be deleted"
+    assert body_count(shared) == 1, "Body still used by a live row should be kept"
+
+
+def test_batched_lookup():
+    """Batched lookup should return every stored key from SQLite and omit misses"""
+    key_a = generate_cache_key("batch_a", "batched_content")
+    key_b = generate_cache_key("batch_b", "batched_content")
+    key_big = generate_cache_key("batch_a", "batched_large_content")
+    key_miss = generate_cache_key("batch_a", "batched_miss_content")
+    big = {"nodes": [{"id": f"n{i}", "label": "step " * 20} for i in range(50)]}
+    set_cached_response("batch_a", key_a, {"score": 90})
+    set_cached_response("batch_b", key_b, {"score": 70})
+    set_cached_response("batch_a", key_big, big)
+    clear_l1()
+
+    wanted = [("batch_a", key_a), ("batch_b", key_b), ("batch_a", key_big), ("batch_a", key_miss)]
+    found = get_cached_responses(wanted)
+    assert found[("batch_a", key_a)]["score"] == 90, "Batched lookup lost batch_a"
+    assert found[("batch_b", key_b)]["score"] == 70, "Batched lookup lost batch_b"
+    assert found[("batch_a", key_big)] == big, "Compressed payload did not round-trip in a batch"
+    assert ("batch_a", key_miss) not in found, "Batched lookup should omit misses"
+
+    # The SQLite results populate the L1, so a repeat batch agrees without a query
+    assert get_cached_responses(wanted) == found, "Repeat batch should match the SQLite results"
 
 
 if __name__ == "__main__":
-    print("\n=== Running AI Response Cache Tests ===\n")
-    
-    # Ensure database is initialized
-    init_database()
-    
-    test_cache_key_determinism()
-    test_cache_miss()
-    test_cache_store_and_hit()
-    test_cache_stats()
-    test_different_call_types()
-    
-    # Cleanup test entries
-    cleanup_expired_cache()
-    
-    print("\n=== All tests PASSED ✅ ===\n")
+    sys.exit(pytest.main([__file__, "-q"]))
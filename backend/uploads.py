@@ -0,0 +1,17 @@
+"""
+Upload helpers shared by the document parser, the analyzers and the evaluators.
+Kept dependency-free so importing it doesn't pull in a parser or Gemini client.
+"""
+
+import binascii
+
+
+def decode_base64_upload(data: str) -> bytes:
+    """
+    Decode a base64 upload, with or without a `data:<mime>;base64,` prefix.
+    The string is encoded once and the prefix is skipped through a memoryview,
+    which a2b_base64 reads in place; base64.b64decode would copy the slice first.
+    """
+    raw = data.encode("ascii")
+    start = raw.find(b",") + 1
+    return binascii.a2b_base64(memoryview(raw)[start:])